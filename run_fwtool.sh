@@ -13,6 +13,7 @@ HOST_TOOLS_DIR="${HOST_REPO_ROOT}/tools"
 CONTAINER_OUTPUT_DIR="/repo/output"
 CONTAINER_TOOLS_DIR="/tools"
 CHECKPOINT_JSON="${HOST_OUTPUT_DIR}/progress.json"
+PROGRESS_JSONL="${HOST_OUTPUT_DIR}/progress.jsonl"
 SSH_CONFIG_JSON="${HOST_OUTPUT_DIR}/ssh_config.json"
 AUTOHEAL_RETRIES="${AUTOHEAL_RETRIES:-2}"
 
@@ -147,6 +148,12 @@ show_progress() {
   else
     echo "No progress file found."
   fi
+  # progress.json only holds the current stage; the history lives in progress.jsonl
+  if [[ -f "$PROGRESS_JSONL" ]]; then
+    echo
+    echo "🕑 Recent history:"
+    tail -n 20 "$PROGRESS_JSONL" | jq -c .
+  fi
   pause
 }
 
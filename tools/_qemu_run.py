@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+# _qemu_run.py — shared QEMU serial watcher for qemu_test.py and test_boot.py
+
+import os, re, select, time
+
+# one union pattern over raw bytes: no per-read decode, one search per chunk
+BOOT_OK_RE = re.compile(rb"Linux version|Booting Linux|Starting kernel", re.I)
+# bytes carried over between reads so a banner split across two chunks still matches
+BOOT_OK_OVERLAP = 32
+
+def _pump(proc, logf, deadline, pattern=None):
+    """Copy proc.stdout into logf until deadline, EOF or a pattern hit; returns (matched, eof)."""
+    tail = b""
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return False, False
+        ready, _, _ = select.select([proc.stdout], [], [], remaining)
+        if not ready:
+            continue
+        data = proc.stdout.read()
+        if data is None:  # spurious wakeup
+            continue
+        if not data:  # qemu exited
+            return False, True
+        logf.write(data)
+        if pattern is not None:
+            window = tail + data
+            if pattern.search(window):
+                return True, False
+            tail = window[-BOOT_OK_OVERLAP:]
+
+def _stop(proc):
+    try:
+        proc.terminate()
+        proc.wait(timeout=3)
+    except Exception:
+        try: proc.kill()
+        except Exception: pass
+    proc.stdout.close()
+
+def wait_for_banner(proc, log_path, timeout_s, settle_s=1.0):
+    """Log proc's output (stdout=PIPE, stderr folded in) until a kernel banner or timeout.
+
+    QEMU is stopped either way. Returns {"status": ..., "reason": ...} with status
+    "passed", "failed" (output but no banner) or "failed_no_output".
+    """
+    os.set_blocking(proc.stdout.fileno(), False)
+    # "wb" truncates any previous log; unbuffered so the log is readable live
+    with open(log_path, "wb", buffering=0) as logf:
+        # select() wakes as soon as QEMU writes; each chunk is logged and scanned in one pass
+        matched, exited = _pump(proc, logf, time.monotonic() + timeout_s, BOOT_OK_RE)
+        if matched:
+            # give kernel a moment more (still logging), then stop
+            _pump(proc, logf, time.monotonic() + settle_s)
+        _stop(proc)
+        if matched:
+            return {"status": "passed", "reason": "kernel banner detected"}
+
+        # judge by whether *any* output came out
+        return {"status": "failed" if logf.tell() > 0 else "failed_no_output",
+                "reason": "qemu exited before kernel banner" if exited
+                          else "timeout waiting for kernel banner"}
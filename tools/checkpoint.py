@@ -1,11 +1,16 @@
 #!/usr/bin/env python3
 # checkpoint.py — single source of truth for pipeline stage state
 
-import os, json
+import os, json, copy
 from typing import Any, Dict
 
 OUTPUT_DIR = os.environ.get("OUTPUT_DIR", "/repo/output")
 CHECKPOINT = os.path.join(OUTPUT_DIR, "checkpoint.json")
+# fdatasync the temp file before the rename so a crash can't leave an empty checkpoint
+DURABLE = os.environ.get("K2_CHECKPOINT_DURABLE") == "1"
+
+# last parsed checkpoint, keyed by (mtime, size) so external writers still invalidate it
+_cache: Dict[str, Any] = {"key": None, "data": None}
 
 def _ensure_dir():
     os.makedirs(OUTPUT_DIR, exist_ok=True)
@@ -18,17 +23,44 @@ def _read_json(path: str) -> Dict[str, Any]:
         return {}
 
 def _write_json(path: str, data: Dict[str, Any]) -> None:
+    # encode once and hand the kernel one buffer; json.dump writes per token
+    payload = json.dumps(data, indent=2, sort_keys=True).encode()
     tmp = path + ".tmp"
-    with open(tmp, "w") as f:
-        json.dump(data, f, indent=2, sort_keys=True)
+    fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        view = memoryview(payload)
+        while view:
+            view = view[os.write(fd, view):]
+        if DURABLE:
+            os.fdatasync(fd)
+    finally:
+        os.close(fd)
     os.replace(tmp, path)
 
+def _stat_key(path: str):
+    st = os.stat(path)
+    return (st.st_mtime_ns, st.st_size)
+
+def _remember(data: Dict[str, Any]) -> None:
+    try:
+        _cache["key"] = _stat_key(CHECKPOINT)
+        _cache["data"] = copy.deepcopy(data)
+    except OSError:
+        _cache["key"] = _cache["data"] = None
+
 def get_checkpoint() -> Dict[str, Any]:
     _ensure_dir()
-    data = _read_json(CHECKPOINT)
-    if "stage" not in data:
-        data["stage"] = "none"
-    return data
+    try:
+        key = _stat_key(CHECKPOINT)
+    except OSError:
+        return {"stage": "none"}
+    if key != _cache["key"]:
+        data = _read_json(CHECKPOINT)
+        if "stage" not in data:
+            data["stage"] = "none"
+        _cache["key"], _cache["data"] = key, data
+    # callers mutate what they get back, so never hand out the cached object
+    return copy.deepcopy(_cache["data"])
 
 def stage_done(stage: str, **kwargs):
     _ensure_dir()
@@ -37,6 +69,16 @@ def stage_done(stage: str, **kwargs):
     if kwargs:
         data.setdefault("meta", {}).update(kwargs)
     _write_json(CHECKPOINT, data)
+    _remember(data)
+
+def set_stage(stage: str, **fields):
+    """Set the top-level stage (plus fields such as ts), keeping artifacts/meta intact."""
+    _ensure_dir()
+    data = get_checkpoint()
+    data["stage"] = stage
+    data.update(fields)
+    _write_json(CHECKPOINT, data)
+    _remember(data)
 
 def last_successful_stage() -> str:
     try:
@@ -45,8 +87,29 @@ def last_successful_stage() -> str:
     except Exception:
         return "none"
 
+def _listing(d: str):
+    try:
+        return set(os.listdir(d or "."))
+    except OSError:
+        return None
+
 def require_files(files):
     """Raise FileNotFoundError if a required file is missing."""
-    missing = [p for p in files if not os.path.exists(p)]
+    files = list(files)
+    if len(files) == 1:
+        missing = [f for f in files if not os.path.exists(f)]
+    else:
+        # one getdents per directory rules out absent names without a stat each;
+        # hits are still confirmed with exists() so dangling symlinks fail
+        listings: Dict[str, Any] = {}
+        def present(f) -> bool:
+            p = os.path.normpath(os.fspath(f))
+            d, name = os.path.split(p)
+            if d not in listings:
+                listings[d] = _listing(d)
+            if not name or listings[d] is None:
+                return os.path.exists(p)
+            return name in listings[d] and os.path.exists(p)
+        missing = [f for f in files if not present(f)]
     if missing:
-        raise FileNotFoundError("Missing required files: " + ", ".join(missing))
+        raise FileNotFoundError("Missing required files: " + ", ".join(map(os.fspath, missing)))
@@ -5,13 +5,19 @@ Collect Creality printer configuration, macros, and UI assets from the extracted
 Run automatically during build stage after unsquash.
 """
 
-import os, json, shutil
+import os, re, json, shutil, fnmatch
+from functools import lru_cache
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
 
 ROOTFS = Path("/repo/output/work/rootfs")
 OUT = Path("/repo/output/extracted_configs")
 OUT.mkdir(parents=True, exist_ok=True)
 
+# Hardlink instead of copying when rootfs and OUT share a filesystem.
+# Only safe if nothing downstream edits the collected files in place.
+LINK_FILES = os.environ.get("K2_COLLECT_LINK") == "1"
+
 patterns = {
     "printer_cfg": ["**/printer*.cfg"],
     "creality_cfg": [
@@ -24,30 +30,124 @@ patterns = {
     "services": ["**/systemd/system/*creality*.service"],
 }
 
+# Globs are matched segment by segment while descending the rootfs. A walk
+# state is (pattern index, segment index); "**" keeps its state alive.
+_GLOBS = [(category, g.split("/")) for category, globs in patterns.items() for g in globs]
+
+@lru_cache(maxsize=None)
+def _closure(states):
+    out, todo = set(), list(states)
+    while todo:
+        pid, i = state = todo.pop()
+        if state in out:
+            continue
+        out.add(state)
+        segs = _GLOBS[pid][1]
+        if segs[i] == "**" and i + 1 < len(segs):
+            todo.append((pid, i + 1))
+    return frozenset(out)
+
+_START = _closure(frozenset((pid, 0) for pid in range(len(_GLOBS))))
+
+@lru_cache(maxsize=None)
+def _node(live):
+    """Index live states by next segment: literals via dict lookup, wildcards via regex."""
+    literal, wild, stay = {}, [], []
+    for pid, i in live:
+        seg = _GLOBS[pid][1][i]
+        if seg == "**":
+            stay.append((pid, i))
+        elif any(c in seg for c in "*?["):
+            wild.append((re.compile(fnmatch.translate(seg)), pid, i))
+        else:
+            literal.setdefault(seg, []).append((pid, i))
+    return literal, wild, stay
+
+def scan(root):
+    """Walk root once and bucket every file into the categories it matches."""
+    found = {category: [] for category in patterns}
+    stack = [(os.fspath(root), _START)]
+    while stack:
+        dirpath, live = stack.pop()
+        literal, wild, stay = _node(live)
+        try:
+            it = os.scandir(dirpath)
+        except OSError:
+            continue
+        with it:
+            for entry in it:
+                name = entry.name
+                hit = literal.get(name, [])
+                if wild:
+                    hit = hit + [(pid, i) for rx, pid, i in wild if rx.match(name)]
+                if entry.is_dir():
+                    # like Path.glob: a named/wildcard segment follows a symlinked dir,
+                    # "**" never recurses through one
+                    nxt = [(pid, i + 1) for pid, i in hit if i + 1 < len(_GLOBS[pid][1])]
+                    if not entry.is_symlink():
+                        nxt += stay
+                    nxt = _closure(frozenset(nxt))
+                    if nxt:
+                        stack.append((entry.path, nxt))
+                elif hit and entry.is_file():  # is_file() drops broken symlinks
+                    for category in {_GLOBS[pid][0] for pid, i in hit if i == len(_GLOBS[pid][1]) - 1}:
+                        found[category].append(entry.path)
+    return found
+
+def _link_or_clone(src, dest):
+    # never write through an old hardlink into the rootfs
+    try:
+        os.unlink(dest)
+    except FileNotFoundError:
+        pass
+    try:
+        os.link(src, dest)
+        return
+    except OSError:
+        pass
+    # copy_file_range lets XFS/Btrfs reflink and otherwise stays in-kernel
+    with open(src, "rb") as s, open(dest, "wb") as d:
+        remaining = os.fstat(s.fileno()).st_size
+        while remaining > 0:
+            n = os.copy_file_range(s.fileno(), d.fileno(), remaining)
+            if n == 0:
+                break
+            remaining -= n
+
 def safe_copy(src):
-    rel = src.relative_to(ROOTFS)
-    dest = OUT / rel
-    dest.parent.mkdir(parents=True, exist_ok=True)
+    # destination parents are created up front by copy_all()
+    dest = OUT / src.relative_to(ROOTFS)
+    if LINK_FILES:
+        try:
+            _link_or_clone(src, dest)
+            return True
+        except OSError:
+            pass
     try:
         shutil.copy2(src, dest)
         return True
     except Exception:
         return False
 
+def copy_all(paths):
+    """Copy matched files into OUT, overlapping the per-file syscalls across threads."""
+    srcs = sorted({Path(p) for p in paths})
+    for parent in {(OUT / s.relative_to(ROOTFS)).parent for s in srcs}:
+        parent.mkdir(parents=True, exist_ok=True)
+    workers = min(32, (os.cpu_count() or 1) * 4)
+    with ThreadPoolExecutor(max_workers=workers) as ex:
+        return list(ex.map(safe_copy, srcs))
+
 results = {}
 
 print(f"[collect_configs] Searching in {ROOTFS}")
 
-for category, globs in patterns.items():
-    found = []
-    for g in globs:
-        for p in ROOTFS.glob(g):
-            if p.is_file():
-                found.append(str(p))
-                safe_copy(p)
+for category, found in scan(ROOTFS).items():
     results[category] = found
     print(f"[collect_configs] {category}: {len(found)} found")
 
+copy_all(p for found in results.values() for p in found)
+
 # Save summary
 with open(OUT / "report.json", "w", encoding="utf-8") as f:
     json.dump(results, f, indent=2)
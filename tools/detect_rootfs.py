@@ -4,6 +4,7 @@
 # Verifies and normalizes extracted rootfs
 # ==========================================================
 import os, sys, json
+from collections import deque
 from pathlib import Path
 from datetime import datetime
 
@@ -15,7 +16,27 @@ def log(msg):
     print(f"[detect_rootfs] {msg}", flush=True)
 
 def write_checkpoint(stage):
-    CHECKPOINT.write_text(json.dumps({"stage": stage, "ts": datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")}, indent=2))
+    payload = json.dumps({"stage": stage, "ts": datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")}, indent=2).encode()
+    tmp = CHECKPOINT.with_suffix(".json.tmp")
+    tmp.write_bytes(payload)
+    os.replace(tmp, CHECKPOINT)
+
+def find_rootfs(base):
+    # BFS over the extracted tree; d_type from scandir avoids a stat per entry
+    dq = deque([str(base)])
+    while dq:
+        try:
+            it = os.scandir(dq.popleft())
+        except OSError:
+            continue
+        with it:
+            for entry in it:
+                if not entry.is_dir(follow_symlinks=False):
+                    continue
+                if entry.name == "rootfs":
+                    return Path(entry.path)
+                dq.append(entry.path)
+    return None
 
 def main():
     log(f"Looking for extracted rootfs at: {EXTRACTED}")
@@ -23,7 +44,7 @@ def main():
         log("❌ No extracted firmware found. Run generate_fw first.")
         sys.exit(1)
 
-    rootfs = next(EXTRACTED.rglob("rootfs"), None)
+    rootfs = find_rootfs(EXTRACTED)
     if not rootfs:
         log("❌ rootfs directory not found after extraction.")
         sys.exit(1)
@@ -1,12 +1,16 @@
 #!/opt/k2env/bin/python3
-import os, re, sys, requests
-from bs4 import BeautifulSoup
+import os, re, sys, html, json, shutil, requests
 from tools.logger import log
 from tools.checkpoint import stage_done
 
 PAGE = "https://www.creality.com/download/creality-k2-plus-cfs-combo"
 OUT_DIR = "/repo/output"
 OUT_IMG = os.path.join(OUT_DIR, "latest_firmware.img")
+OUT_META = OUT_IMG + ".meta.json"
+CHUNK = 1024 * 1024
+# bytes patterns so the page never has to be decoded as a whole
+IMG_HREF_RE = re.compile(rb"""<a\s[^>]*?href\s*=\s*["']([^"']+?\.img)["']""", re.I)
+IMG_URL_RE = re.compile(rb"""https?://[^\s"']+\.img""")
 HDRS = {
     "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 13.5) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.0 Safari/605.1.15",
     "Referer": "https://www.creality.com/",
@@ -16,33 +20,118 @@ def find_url():
     log(f"🔍 Fetching {PAGE}")
     r = requests.get(PAGE, headers=HDRS, timeout=20)
     r.raise_for_status()
-    soup = BeautifulSoup(r.text, "html.parser")
-    links = [a["href"] for a in soup.find_all("a", href=True) if a["href"].endswith(".img")]
-    if links:
-        return links[0]
-    m = re.search(r"https?://[^\s\"']+\.img", r.text)
-    return m.group(0) if m else None
-
-def download(url: str, out: str):
+    m = IMG_HREF_RE.search(r.content)
+    if m:
+        return html.unescape(m.group(1).decode("utf-8", "ignore"))
+    m = IMG_URL_RE.search(r.content)
+    return m.group(0).decode("utf-8", "ignore") if m else None
+
+def remote_meta(url: str) -> dict:
+    r = requests.head(url, headers=HDRS, allow_redirects=True, timeout=20)
+    r.raise_for_status()
+    size = r.headers.get("Content-Length", "")
+    return {
+        "url": url,
+        "etag": r.headers.get("ETag"),
+        "last_modified": r.headers.get("Last-Modified"),
+        "content_length": int(size) if size.isdigit() and "Content-Encoding" not in r.headers else None,
+    }
+
+def read_meta() -> dict:
+    try:
+        with open(OUT_META, "r") as f:
+            return json.load(f)
+    except Exception:
+        return {}
+
+def write_meta(meta: dict):
+    tmp = OUT_META + ".tmp"
+    with open(tmp, "w") as f:
+        f.write(json.dumps(meta, indent=2))
+    os.replace(tmp, OUT_META)
+
+def same_artifact(a: dict, b: dict) -> bool:
+    keys = ("url", "etag", "last_modified", "content_length")
+    return all(a.get(k) == b.get(k) for k in keys)
+
+def download(url: str, out: str, offset: int = 0):
     os.makedirs(os.path.dirname(out), exist_ok=True)
-    log(f"⬇️  Downloading → {url}")
-    with requests.get(url, headers=HDRS, stream=True, timeout=120) as r:
+    hdrs = dict(HDRS)
+    if offset:
+        hdrs["Range"] = f"bytes={offset}-"
+        log(f"⏯️  Resuming at byte {offset} → {url}")
+    else:
+        log(f"⬇️  Downloading → {url}")
+    with requests.get(url, headers=hdrs, stream=True, timeout=120) as r:
         r.raise_for_status()
-        with open(out, "wb") as f:
-            for chunk in r.iter_content(8192):
-                if chunk: f.write(chunk)
+        if offset and r.status_code != 206:
+            log("⚠️  Server ignored the range request; restarting from scratch")
+            offset = 0
+        r.raw.decode_content = True
+        with open(out, "ab" if offset else "wb") as f:
+            size = r.headers.get("Content-Length")
+            if not offset and size and size.isdigit() and "Content-Encoding" not in r.headers:
+                try:
+                    os.posix_fallocate(f.fileno(), 0, int(size))
+                except OSError:
+                    pass
+            try:
+                shutil.copyfileobj(r.raw, f, length=CHUNK)
+            finally:
+                f.truncate()  # drop any preallocated tail, so a partial file can be resumed
     log(f"✅ Saved → {out}")
 
 def main():
-    if os.path.exists(OUT_IMG):
+    have = os.path.getsize(OUT_IMG) if os.path.exists(OUT_IMG) else None
+    meta = read_meta()
+    try:
+        url = find_url()
+    except requests.RequestException as e:
+        if have is None:
+            raise
+        log(f"⚠️  Could not check upstream ({e}); keeping existing firmware")
+        url = None
+
+    remote = None
+    if url:
+        try:
+            remote = remote_meta(url)
+        except requests.RequestException as e:
+            # many CDNs refuse HEAD on signed GET URLs; a plain GET may still work
+            if have is not None and meta.get("complete", True):
+                log(f"⚠️  Could not check upstream ({e}); keeping existing firmware")
+                url = None
+            else:
+                log(f"⚠️  HEAD failed ({e}); downloading without resume support")
+
+    if not url:
+        if have is None:
+            log("❌ Could not find firmware URL")
+            sys.exit(1)
         log(f"⏩ Found existing firmware: {OUT_IMG}")
         stage_done("downloaded", firmware=OUT_IMG)
         return
-    url = find_url()
-    if not url:
-        log("❌ Could not find firmware URL")
-        sys.exit(1)
-    download(url, OUT_IMG)
+
+    if remote is None:
+        # nothing to validate a partial file against later, so record the URL only
+        write_meta({"url": url, "complete": False})
+        download(url, OUT_IMG)
+        write_meta({"url": url, "complete": True})
+        stage_done("downloaded", firmware=OUT_IMG)
+        return
+
+    unchanged = have is not None and same_artifact(meta, remote)
+    if unchanged and meta.get("complete") and have == (remote["content_length"] or have):
+        log(f"⏩ Firmware unchanged upstream: {OUT_IMG}")
+        stage_done("downloaded", firmware=OUT_IMG)
+        return
+
+    offset = 0
+    if unchanged and remote["content_length"] and have < remote["content_length"]:
+        offset = have
+    write_meta({**remote, "complete": False})
+    download(url, OUT_IMG, offset)
+    write_meta({**remote, "complete": True})
     stage_done("downloaded", firmware=OUT_IMG)
 
 if __name__ == "__main__":
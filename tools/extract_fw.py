@@ -18,11 +18,8 @@ def main():
         shutil.rmtree(EXTRACT_DIR)
     EXTRACT_DIR.mkdir(parents=True, exist_ok=True)
 
-    # ✅ Run binwalk inside EXTRACT_DIR
-    subprocess.check_call([
-        "bash", "-c",
-        f"cd {EXTRACT_DIR} && binwalk --run-as=root -e {FW_IMG}"
-    ])
+    # ✅ Run binwalk inside EXTRACT_DIR (binwalk needs a seekable file, so no stdin pipe)
+    subprocess.check_call(["binwalk", "--run-as=root", "-e", str(FW_IMG)], cwd=EXTRACT_DIR)
 
     # ✅ Verify extraction target exists
     if not MARK.exists():
@@ -14,6 +14,7 @@ Purpose:
 import argparse
 import json
 import os
+import re
 import subprocess
 import sys
 import time
@@ -28,6 +29,14 @@ STATE_DIR = OUT_DIR / "device_state"
 STATE_DIR.mkdir(parents=True, exist_ok=True)
 CHECKPOINT_FILE = OUT_DIR / "checkpoint.json"
 
+# Share one authenticated connection across every ssh call to the printer:
+# the first call becomes the master, later ones skip TCP + KEX + auth.
+SSH_MUX_OPTS = [
+    "-o", "ControlMaster=auto",
+    "-o", "ControlPath=/tmp/k2ssh-%r@%h-%p",
+    "-o", "ControlPersist=30s",
+]
+
 # ---------------------------------------------------------------------
 # Utilities
 # ---------------------------------------------------------------------
@@ -64,11 +73,16 @@ def ssh_cmd(host, user, port, password, remote_cmd):
         "ssh",
         "-o", "StrictHostKeyChecking=no",
         "-o", "PreferredAuthentications=password",
+        *SSH_MUX_OPTS,
         "-p", str(port),
         f"{user}@{host}",
         remote_cmd,
     ]
 
+def close_master(host, user, port):
+    """Tear down the multiplexed master connection (if one is still up)."""
+    run(["ssh", *SSH_MUX_OPTS, "-O", "exit", "-p", str(port), f"{user}@{host}"])
+
 def save_checkpoint(stage="fetch_metadata_complete", meta=None):
     """Write progress checkpoint for orchestrator."""
     data = {
@@ -76,12 +90,16 @@ def save_checkpoint(stage="fetch_metadata_complete", meta=None):
         "ts": now(),
         "meta": meta or {},
     }
-    with open(CHECKPOINT_FILE, "w") as f:
-        json.dump(data, f, indent=2)
+    payload = json.dumps(data, indent=2).encode()
+    tmp = CHECKPOINT_FILE.with_suffix(".json.tmp")
+    tmp.write_bytes(payload)
+    os.replace(tmp, CHECKPOINT_FILE)
 
 # ---------------------------------------------------------------------
 # Metadata collection
 # ---------------------------------------------------------------------
+SECTION_RE = re.compile(r"---BEGIN:(\w+)---\n(.*?)---END:\1---", re.S)
+
 def collect_metadata(args):
     """Collect OS, kernel, and hardware metadata from printer."""
     info("🧠 Collecting metadata from printer...")
@@ -97,11 +115,18 @@ def collect_metadata(args):
         "inputs": "ls /dev/fb* /dev/video* /dev/input* 2>/dev/null || true",
     }
 
+    # One remote shell runs every probe; each section is framed so it can be split locally
+    script = "\n".join(
+        f'echo "---BEGIN:{key}---"; {{ {cmd}; }} 2>&1; echo; echo "---END:{key}---"'
+        for key, cmd in commands.items()
+    )
+    info(f"📋 Gathering {', '.join(commands)} ...")
+    r = run(ssh_cmd(args.host, args.user, args.port, args.password, script))
+    sections = {m.group(1): m.group(2) for m in SECTION_RE.finditer(safe_decode(r.stdout or b""))}
+
     meta = {"host": args.host, "timestamp": now(), "results": {}}
-    for key, cmd in commands.items():
-        info(f"📋 Gathering {key} ...")
-        r = run(ssh_cmd(args.host, args.user, args.port, args.password, cmd))
-        meta["results"][key] = safe_decode(r.stdout or b"").strip()
+    for key in commands:
+        meta["results"][key] = sections.get(key, "").strip()
 
     # Save all data to a single metadata.json file
     meta_file = STATE_DIR / "metadata.json"
@@ -133,7 +158,10 @@ def main():
         sys.exit(2)
 
     info("✅ SSH connection verified.")
-    meta = collect_metadata(args)
+    try:
+        meta = collect_metadata(args)
+    finally:
+        close_master(args.host, args.user, args.port)
 
     # Record success checkpoint
     save_checkpoint(stage="fetch_metadata_complete", meta={"status": "ok", "host": args.host})
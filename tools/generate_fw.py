@@ -6,14 +6,19 @@ import os
 import sys
 import re
 import hashlib
+import mmap
+import shutil
 import subprocess
 import json
 import requests
-from bs4 import BeautifulSoup
+from concurrent.futures import ThreadPoolExecutor
 from colorama import Fore, Style, init
 
 init(autoreset=True)
 
+# one pooled keep-alive session for the page scrape, HEAD checks and the download
+SESSION = requests.Session()
+
 # -------------------------------------------------------------------------
 # Logging Helpers
 # -------------------------------------------------------------------------
@@ -25,13 +30,6 @@ def log_success(msg): print(f"{Fore.GREEN}[generate_fw] [SUCCESS] {msg}{Style.RE
 # -------------------------------------------------------------------------
 # Utilities
 # -------------------------------------------------------------------------
-def sha256sum(path):
-    h = hashlib.sha256()
-    with open(path, "rb") as f:
-        for chunk in iter(lambda: f.read(8192), b""):
-            h.update(chunk)
-    return h.hexdigest()
-
 def run(cmd, cwd=None, capture=True):
     if capture:
         result = subprocess.run(cmd, cwd=cwd, shell=False,
@@ -40,32 +38,163 @@ def run(cmd, cwd=None, capture=True):
         result = subprocess.run(cmd, cwd=cwd, shell=False)
     return result
 
+def unsquashfs_cmd(dest, img):
+    # decompress on every core; keep xattrs so file capabilities survive the rebuild
+    return ["unsquashfs", "-processors", str(os.cpu_count() or 1), "-no-progress",
+            "-d", dest, img]
+
+def compression_of(file_type):
+    """Name the decoder for a `file` description, or None if it isn't a known compressor."""
+    t = file_type.lower()
+    if "zstandard" in t or "zstd" in t:
+        return "zstd"
+    if "lz4" in t:
+        return "lz4"
+    if "xz" in t:
+        return "xz"
+    return None
+
+def file_types(paths):
+    """Map each path to its libmagic description, using one `file` process for all of them."""
+    paths = list(paths)
+    if len(paths) == 1:
+        return {paths[0]: subprocess.check_output(["file", "-b", paths[0]], text=True).strip()}
+    # -f - reads names from stdin; -0 puts a NUL after each name in the output
+    out = subprocess.run(["file", "-0", "-N", "-f", "-"], input="\n".join(paths),
+                         stdout=subprocess.PIPE, text=True, check=True).stdout
+    types = {}
+    for line in out.splitlines():
+        name, _, desc = line.partition("\0")
+        types[name] = desc.lstrip(":").strip()
+    return types
+
 # -------------------------------------------------------------------------
 # Detect latest firmware link
 # -------------------------------------------------------------------------
+# first absolute .img link on the download page; scanned as bytes, no DOM build
+_HREF_IMG = re.compile(rb"""href=["'](https?://[^"']+?\.img)["']""", re.I)
+
 def detect_latest_firmware_url():
     fw_page = "https://www.creality.com/download/creality-k2-plus-cfs-combo"
     log_info(f"🌐 Checking Creality firmware page: {fw_page}")
     try:
-        r = requests.get(fw_page, timeout=20)
+        r = SESSION.get(fw_page, timeout=20)
         r.raise_for_status()
-        soup = BeautifulSoup(r.text, "lxml")
-        link = soup.find("a", href=re.compile(r"\.img$", re.I))
-        if link and link["href"].startswith("http"):
-            return link["href"]
+        m = _HREF_IMG.search(r.content)
+        if m:
+            return m.group(1).decode()
     except Exception as e:
         log_warn(f"Failed to fetch firmware page: {e}")
     # fallback — verified mirror
     return "https://file2-cdn.creality.com/file/0be5c59fef5b8640712d8213a0ed1cc2/CR0CN240110C10_ota_img_V1.1.2.10.img"
 
+# -------------------------------------------------------------------------
+# Download + sidecar cache (<img>.etag / <img>.sha256)
+# -------------------------------------------------------------------------
+def remote_validator(url):
+    """ETag of the upstream image (or Last-Modified + size), or None if unknown."""
+    try:
+        head = SESSION.head(url, timeout=10, allow_redirects=True)
+        head.raise_for_status()
+    except Exception as e:
+        log_warn(f"HEAD {url} failed: {e}")
+        return None
+    etag = head.headers.get("ETag")
+    if etag:
+        return etag
+    modified = head.headers.get("Last-Modified")
+    return f"{modified}|{head.headers.get('Content-Length', '')}" if modified else None
+
+def cached_hash(img_path, validator):
+    """SHA-256 recorded for img_path if it was downloaded from the same upstream version."""
+    if not validator or not os.path.exists(img_path):
+        return None
+    try:
+        with open(img_path + ".etag", "r") as f:
+            if f.read() != validator:
+                return None
+        with open(img_path + ".sha256", "r") as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+def store_hash(img_path, validator, fw_hash):
+    with open(img_path + ".sha256", "w") as f:
+        f.write(fw_hash + "\n")
+    if validator:
+        with open(img_path + ".etag", "w") as f:
+            f.write(validator)
+
+def download_firmware(url, img_path):
+    """Download url to img_path and return its SHA-256, hashed while writing."""
+    # a stale sidecar must never vouch for a half-written image
+    for sidecar in (img_path + ".etag", img_path + ".sha256"):
+        if os.path.exists(sidecar):
+            os.remove(sidecar)
+    h = hashlib.sha256()
+    resp = SESSION.get(url, stream=True, timeout=60)
+    resp.raise_for_status()
+    with open(img_path, "wb") as f:
+        # hash while writing so the image is never read back just to digest it
+        for chunk in resp.iter_content(chunk_size=1024 * 1024):
+            if chunk:
+                h.update(chunk)
+                f.write(chunk)
+    return h.hexdigest()
+
+def prefetch_upstream():
+    """Clone/update the inject_upstream repos in the background while the firmware downloads."""
+    try:
+        from inject_upstream import ensure_repos
+    except Exception as e:
+        log_warn(f"Upstream prefetch unavailable: {e}")
+        return None
+    ex = ThreadPoolExecutor(max_workers=1)
+    future = ex.submit(ensure_repos)
+    ex.shutdown(wait=False)
+    return future
+
 # -------------------------------------------------------------------------
 # Extraction Logic — handles SquashFS, ext4, and nested CPIO containers
 # -------------------------------------------------------------------------
+_CPIO_NEWC = (b"070701", b"070702")
+_SQUASHFS_LE = re.compile(rb"hsqs")
+
+def _cpio_members(mm):
+    """Yield (header offset, name) for the newc/crc CPIO members starting at offset 0."""
+    off = 0
+    while mm[off:off + 6] in _CPIO_NEWC:
+        filesize = int(mm[off + 54:off + 62], 16)
+        namesize = int(mm[off + 94:off + 102], 16)
+        name = bytes(mm[off + 110:off + 110 + namesize - 1])
+        if name == b"TRAILER!!!":
+            return
+        yield off, name
+        data = (off + 110 + namesize + 3) & ~3
+        off = (data + filesize + 3) & ~3
+
+def find_rootfs_offset(img_path):
+    """Offset of the rootfs inside the image, found in-process instead of via `binwalk --term`.
+
+    Like the binwalk scan it replaces, a CPIO member named *rootfs* wins; otherwise the
+    first SquashFS 4.x superblock is used.
+    """
+    if os.path.getsize(img_path) == 0:
+        return None
+    with open(img_path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        for off, name in _cpio_members(mm):
+            if b"rootfs" in name.lower():
+                return off
+        for m in _SQUASHFS_LE.finditer(mm):
+            if mm[m.start() + 28:m.start() + 30] == b"\x04\x00":
+                return m.start()
+    return None
+
 def try_extract_rootfs(img_path, extract_dir, output_dir):
     log_info("🧯 Unsquashing rootfs (SquashFS)…")
     unsquash_out = os.path.join(extract_dir, "rootfs")
     os.makedirs(unsquash_out, exist_ok=True)
-    result = subprocess.run(["unsquashfs", "-d", unsquash_out, img_path],
+    result = subprocess.run(unsquashfs_cmd(unsquash_out, img_path),
                             stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
     stderr = result.stderr.strip()
     stdout = result.stdout.strip()
@@ -81,18 +210,10 @@ def try_extract_rootfs(img_path, extract_dir, output_dir):
     # Fallback: Detect CPIO block layout
     log_warn("unsquashfs failed; analyzing nested rootfs block…")
     try:
-        bw_out = subprocess.check_output(["binwalk", "--quiet", "--term", img_path], text=True)
+        rootfs_offset = find_rootfs_offset(img_path)
     except Exception as e:
-        log_error(f"binwalk analysis failed: {e}")
-        bw_out = ""
-
-    rootfs_offset = None
-    for line in bw_out.splitlines():
-        if "rootfs" in line.lower():
-            parts = line.strip().split()
-            if parts and parts[0].isdigit():
-                rootfs_offset = int(parts[0])
-                break
+        log_error(f"rootfs offset scan failed: {e}")
+        rootfs_offset = None
 
     # NEW PATCH — fallback for CPIO-based Creality OTA bundles
     if rootfs_offset is None:
@@ -100,10 +221,8 @@ def try_extract_rootfs(img_path, extract_dir, output_dir):
         try:
             cpio_dir = os.path.join(extract_dir, "cpio-root")
             os.makedirs(cpio_dir, exist_ok=True)
-            subprocess.run(
-                ["bash", "-c", f"cd '{cpio_dir}' && cpio -idmv < '{img_path}'"],
-                check=False,
-            )
+            with open(img_path, "rb") as src:
+                subprocess.run(["cpio", "-idmv"], cwd=cpio_dir, stdin=src, check=False)
             if os.path.exists(os.path.join(cpio_dir, "rootfs")):
                 log_info("✅ Extracted CPIO container successfully.")
                 rootfs_file = os.path.join(cpio_dir, "rootfs")
@@ -117,19 +236,24 @@ def try_extract_rootfs(img_path, extract_dir, output_dir):
         # Normal binary offset mode
         rootfs_file = os.path.join(output_dir, "work", "rootfs.img")
         try:
-            dd_cmd = ["dd", f"if={img_path}", f"of={rootfs_file}", f"bs=1", f"skip={rootfs_offset}"]
-            subprocess.run(dd_cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            # carve the tail of the image in 1 MiB blocks (was dd bs=1: one syscall per byte)
+            with open(img_path, "rb") as src, open(rootfs_file, "wb") as dst:
+                src.seek(rootfs_offset)
+                shutil.copyfileobj(src, dst, 1024 * 1024)
         except Exception as e:
-            log_error(f"dd failed: {e}")
+            log_error(f"rootfs carve failed: {e}")
+            return False
+        if os.path.getsize(rootfs_file) == 0:
+            log_error(f"rootfs carve produced an empty file (offset {rootfs_offset})")
             return False
 
     # Inspect rootfs file
-    file_type = subprocess.check_output(["file", "-b", rootfs_file], text=True).strip()
+    file_type = file_types([rootfs_file])[rootfs_file]
     log_info(f"🔍 rootfs.img detected type: {file_type}")
 
     if "Squashfs" in file_type:
         log_info("🧯 Unsquashing nested SquashFS rootfs.img …")
-        res = subprocess.run(["unsquashfs", "-d", unsquash_out, rootfs_file],
+        res = subprocess.run(unsquashfs_cmd(unsquash_out, rootfs_file),
                              stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
         return (res.returncode == 0)
 
@@ -143,15 +267,23 @@ def try_extract_rootfs(img_path, extract_dir, output_dir):
 
     elif "cpio" in file_type.lower():
         log_info("📦 Extracting cpio rootfs.img …")
-        cmd = f"cd '{unsquash_out}' && cpio -idmv < '{rootfs_file}'"
-        subprocess.run(cmd, shell=True)
+        with open(rootfs_file, "rb") as src:
+            subprocess.run(["cpio", "-idmv"], cwd=unsquash_out, stdin=src)
         return True
 
-    elif any(x in file_type.lower() for x in ("zstd", "lz4", "xz")):
-        log_info("🔓 Decompressing compressed rootfs.img …")
-        decomp_cmd = f"zstd -d '{rootfs_file}' -o '{rootfs_file}.dec' || lz4 -d '{rootfs_file}' '{rootfs_file}.dec' || xz -d -c '{rootfs_file}' > '{rootfs_file}.dec'"
-        subprocess.run(decomp_cmd, shell=True)
-        if os.path.exists(f"{rootfs_file}.dec"):
+    elif compression_of(file_type):
+        fmt = compression_of(file_type)
+        log_info(f"🔓 Decompressing {fmt} rootfs.img …")
+        out = f"{rootfs_file}.dec"
+        # exec only the matching decoder (was: zstd || lz4 || xz through /bin/sh)
+        if fmt == "xz":
+            with open(out, "wb") as dst:
+                res = subprocess.run(["xz", "-d", "-k", "-c", "-T0", rootfs_file], stdout=dst)
+        elif fmt == "zstd":
+            res = subprocess.run(["zstd", "-d", "-f", "-T0", rootfs_file, "-o", out])
+        else:
+            res = subprocess.run(["lz4", "-d", "-f", rootfs_file, out])
+        if res.returncode == 0 and os.path.exists(out):
             log_info("✅ Decompressed successfully.")
             return True
 
@@ -170,6 +302,10 @@ def main():
 
     log_info("🧮 Starting firmware image generation...")
 
+    # git clones are network+disk only; overlap them with the download and extraction.
+    # Only when a build follows (orchestrator sets this); a plain firmware check never injects.
+    upstream = prefetch_upstream() if os.environ.get("K2_PREFETCH_UPSTREAM") == "1" else None
+
     # Detect model from device_state metadata
     metadata_file = os.path.join(output_dir, "device_state", "metadata.json")
     model = "creality_k2"
@@ -187,20 +323,20 @@ def main():
     fw_url = detect_latest_firmware_url()
     fw_name = os.path.basename(fw_url)
     img_path = os.path.join(work_dir, fw_name)
-    log_info(f"🌐 Downloading firmware from {fw_url} …")
-    try:
-        resp = requests.get(fw_url, stream=True, timeout=60)
-        resp.raise_for_status()
-        with open(img_path, "wb") as f:
-            for chunk in resp.iter_content(chunk_size=8192):
-                if chunk:
-                    f.write(chunk)
-        log_info(f"🔽 Downloaded {fw_name} → {img_path}")
-    except Exception as e:
-        log_error(f"Firmware download failed: {e}")
-        sys.exit(1)
+    validator = remote_validator(fw_url)
+    fw_hash = cached_hash(img_path, validator)
+    if fw_hash:
+        log_info(f"⏩ {fw_name} unchanged upstream; reusing {img_path}")
+    else:
+        log_info(f"🌐 Downloading firmware from {fw_url} …")
+        try:
+            fw_hash = download_firmware(fw_url, img_path)
+            log_info(f"🔽 Downloaded {fw_name} → {img_path}")
+        except Exception as e:
+            log_error(f"Firmware download failed: {e}")
+            sys.exit(1)
+        store_hash(img_path, validator, fw_hash)
 
-    fw_hash = sha256sum(img_path)
     log_info(f"📦 SHA256: {fw_hash}")
 
     ok = try_extract_rootfs(img_path, extract_dir, output_dir)
@@ -209,6 +345,13 @@ def main():
         sys.exit(1)
 
     log_success("✅ Extraction complete.")
+
+    if upstream is not None:
+        try:
+            upstream.result()
+            log_info("📚 Upstream repos prefetched.")
+        except Exception as e:
+            log_warn(f"Upstream prefetch failed ({e}); inject_upstream will retry.")
     log_success("✅ Firmware retrieval step complete.")
     return 0
 
@@ -1,5 +1,6 @@
 #!/usr/bin/env python3
-import os, sys, subprocess, json
+import os, sys, shutil, subprocess, json
+from concurrent.futures import ThreadPoolExecutor
 from colorama import Fore, Style
 from utils import run, ensure_dir, write_text
 from progress import update_progress
@@ -17,11 +18,21 @@ REPOS = {
 }
 
 def ensure_repo(name, url, dest):
+    # tip of the default branch only; never pull other refs or deepen history
     if not os.path.exists(dest):
-        run(["git", "clone", "--depth", "1", url, dest])
+        run(["git", "clone", "--depth", "1", "--single-branch", url, dest])
     else:
-        run(["git", "fetch", "--all"], cwd=dest)
-        run(["git", "reset", "--hard", "origin/master"], cwd=dest)
+        run(["git", "fetch", "--depth", "1", "origin", "HEAD"], cwd=dest)
+        run(["git", "reset", "--hard", "FETCH_HEAD"], cwd=dest)
+
+def ensure_repos():
+    """Clone/update every upstream repo concurrently; they are independent and network-bound."""
+    ensure_dir(UPSTREAM_DIR)
+    with ThreadPoolExecutor(max_workers=len(REPOS)) as ex:
+        futures = [ex.submit(ensure_repo, name, url, os.path.join(UPSTREAM_DIR, name))
+                   for name, url in REPOS.items()]
+        for f in futures:
+            f.result()
 
 def main():
     ck = get_checkpoint()
@@ -30,15 +41,15 @@ def main():
         print(f"{Fore.RED}[inject_upstream] ❌ Missing rootfs_dir. Run unsquash first.{Style.RESET_ALL}")
         sys.exit(1)
 
-    ensure_dir(UPSTREAM_DIR)
     print(f"{Fore.CYAN}[inject_upstream]{Style.RESET_ALL} Cloning / updating upstream projects …")
-    for name, url in REPOS.items():
-        ensure_repo(name, url, os.path.join(UPSTREAM_DIR, name))
+    ensure_repos()
 
     # Example: copy Mainsail web UI into the image
     target_www = os.path.join(rootfs, "usr/share/mainsail")
+    # the tree is replaced wholesale, so skip rsync's compare pass over the destination
+    shutil.rmtree(target_www, ignore_errors=True)
     ensure_dir(target_www)
-    run(["rsync", "-a", "--delete", os.path.join(UPSTREAM_DIR, "mainsail/"), target_www])
+    run(["cp", "-a", "--reflink=auto", os.path.join(UPSTREAM_DIR, "mainsail", "."), target_www])
 
     # Drop a marker config
     write_text(os.path.join(rootfs, "etc/k2rebuild.conf"), "K2REBUILD_INJECTED=1\n")
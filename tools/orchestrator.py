@@ -3,32 +3,29 @@
 # K2Rebuild - orchestrator.py
 # Unified firmware build coordinator with auto-fetch
 # ==========================================================
-import os, sys, json, subprocess, time
+import os, sys, subprocess, time, importlib, traceback
 from datetime import datetime
 from pathlib import Path
+from checkpoint import get_checkpoint, set_stage
 
 TOOLS_DIR = Path("/tools")
 OUTPUT_DIR = Path("/repo/output")
-CHECKPOINT = OUTPUT_DIR / "checkpoint.json"
 DEVICE_STATE = OUTPUT_DIR / "device_state"
 EXTRACTED = OUTPUT_DIR / "extracted" / "_latest_firmware.img.extracted"
 
+
 def log(msg, level="INFO"):
     now = datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
     print(f"[{now}] [{level}] {msg}", flush=True)
 
 def checkpoint(stage):
-    data = {"stage": stage, "ts": datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")}
-    CHECKPOINT.write_text(json.dumps(data, indent=2))
+    # through checkpoint.py: atomic, same format, keeps what the stages recorded
+    set_stage(stage, ts=datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S"))
     log(f"🧩 Checkpoint updated → {stage}")
 
 def read_checkpoint():
-    if CHECKPOINT.exists():
-        try:
-            return json.load(open(CHECKPOINT)).get("stage", "none")
-        except Exception:
-            return "none"
-    return "none"
+    # checkpoint.py caches the parsed file on (mtime_ns, size)
+    return get_checkpoint().get("stage", "none")
 
 def ensure_firmware_present():
     """Ensure rootfs and firmware image exist, else trigger generate_fw.py automatically"""
@@ -41,7 +38,9 @@ def ensure_firmware_present():
 
     log("⚠️ Firmware image or rootfs missing — invoking generate_fw.py …", "WARN")
     try:
-        subprocess.check_call(["python3", str(TOOLS_DIR / "generate_fw.py")])
+        # a build follows, so let generate_fw clone the upstream repos during the download
+        subprocess.check_call(["python3", str(TOOLS_DIR / "generate_fw.py")],
+                              env={**os.environ, "K2_PREFETCH_UPSTREAM": "1"})
         rootfs_dir = next(EXTRACTED.rglob("rootfs"), None)
         if not rootfs_dir or not rootfs_dir.is_dir():
             log("❌ Firmware generation failed — rootfs not found.", "ERROR")
@@ -52,22 +51,47 @@ def ensure_firmware_present():
         log(f"❌ generate_fw.py failed with exit code {e.returncode}", "ERROR")
         sys.exit(e.returncode)
 
-def run_stage(script_name):
+def _run_in_process(script_name):
+    """Import the stage module and call its main(); returns a process-style exit code."""
+    if str(TOOLS_DIR) not in sys.path:
+        sys.path.insert(0, str(TOOLS_DIR))
+    try:
+        rc = importlib.import_module(script_name).main()
+    except SystemExit as e:
+        rc = e.code
+    except Exception as e:
+        # same full traceback the subprocess runner used to show on stderr
+        traceback.print_exc()
+        log(f"❌ Stage '{script_name}' raised {e!r}", "ERROR")
+        return 1
+    if rc is None or isinstance(rc, int):
+        return rc or 0
+    log(str(rc), "ERROR")  # sys.exit("message") style
+    return 1
+
+def run_stage(script_name, isolate=False):
     path = TOOLS_DIR / f"{script_name}.py"
     if not path.exists():
         log(f"❌ Missing tool script: {script_name}.py", "ERROR")
         sys.exit(1)
     log(f"▶️ Running stage: {script_name}")
-    try:
-        subprocess.check_call(["python3", str(path)])
-        log(f"✅ Stage '{script_name}' complete")
-    except subprocess.CalledProcessError as e:
-        log(f"❌ Stage '{script_name}' failed with exit code {e.returncode}", "ERROR")
-        sys.exit(e.returncode)
+    if isolate:
+        try:
+            subprocess.check_call(["python3", str(path)])
+        except subprocess.CalledProcessError as e:
+            log(f"❌ Stage '{script_name}' failed with exit code {e.returncode}", "ERROR")
+            sys.exit(e.returncode)
+    else:
+        # same interpreter: no startup/import cost per stage, and module caches persist
+        rc = _run_in_process(script_name)
+        if rc:
+            log(f"❌ Stage '{script_name}' failed with exit code {rc}", "ERROR")
+            sys.exit(rc)
+    log(f"✅ Stage '{script_name}' complete")
 
 def main():
     if len(sys.argv) < 2:
-        print("Usage: orchestrator.py [build|fetch]")
+        print("Usage: orchestrator.py [build [--isolate]|fetch]")
         sys.exit(1)
 
     cmd = sys.argv[1].lower()
@@ -107,15 +131,17 @@ def main():
                     start_idx = i + 1
                     break
 
+        # --isolate: run each stage in its own python3 process, as before
+        isolate = "--isolate" in sys.argv[2:]
         for s in stages[start_idx:]:
-            run_stage(s)
+            run_stage(s, isolate=isolate)
             checkpoint(f"{s}_complete")
 
         log("🎉 Firmware build pipeline completed successfully.")
         sys.exit(0)
 
     else:
-        print("Usage: orchestrator.py [build|fetch]")
+        print("Usage: orchestrator.py [build [--isolate]|fetch]")
         sys.exit(1)
 
 if __name__ == "__main__":
@@ -1,23 +1,81 @@
 #!/usr/bin/env python3
 import os
+import re
 import subprocess
 import sys
 from pathlib import Path
 import json
 import time
+from concurrent.futures import ThreadPoolExecutor
 
 SSH_TIMEOUT = "10"
+SSH_OPTS = ["-o", "StrictHostKeyChecking=no", "-o", f"ConnectTimeout={SSH_TIMEOUT}"]
 BACKUP_DIR = Path("/repo/output/printer_backup")
+DUMP_WORKERS = 4
+DD_FAILED = "K2_DD_FAILED"
+SECTION_RE = re.compile(r"===BEGIN:(\w+)===\n(.*?)\n===END:\1:(\d+)===", re.S)
 
 def run(cmd, capture=False):
     print(f"$ {' '.join(cmd)}")
     return subprocess.check_output(cmd).decode() if capture else subprocess.check_call(cmd)
 
+# Once open_master() succeeds every ssh/scp call rides the same connection:
+# one TCP + KEX + auth for the whole run instead of one per command.
+CTRL = f"/tmp/k2_ssh_{os.getpid()}"
+MUX = []
+
 def printer_cmd(ssh, cmd):
-    return run(["ssh", "-o", "StrictHostKeyChecking=no", "-o", f"ConnectTimeout={SSH_TIMEOUT}", ssh, cmd], capture=True)
+    return run(["ssh", *SSH_OPTS, *MUX, ssh, cmd], capture=True)
 
 def fetch(ssh, remote, local):
-    run(["scp", "-r", "-o", "StrictHostKeyChecking=no", f"{ssh}:{remote}", str(local)])
+    run(["scp", "-r", "-o", "StrictHostKeyChecking=no", *MUX, f"{ssh}:{remote}", str(local)])
+
+def open_master(ssh):
+    """Authenticate once and leave a ControlMaster in the background (-f) for later calls."""
+    rc = subprocess.run(["ssh", *SSH_OPTS, "-M", "-N", "-f", "-o", "ControlPersist=5m",
+                         "-o", f"ControlPath={CTRL}", ssh]).returncode
+    if rc == 0:
+        MUX[:] = ["-o", f"ControlPath={CTRL}"]
+    return rc == 0
+
+def close_master(ssh):
+    if MUX:
+        subprocess.run(["ssh", *MUX, "-O", "exit", ssh],
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        MUX.clear()
+
+def printer_cmds(ssh, cmds):
+    """Run every command in one remote shell; returns {key: stdout} with "ERR" for failures."""
+    script = "\n".join(
+        f'echo "===BEGIN:{key}==="; {{ {cmd}; }}; rc=$?; echo; echo "===END:{key}:$rc==="'
+        for key, cmd in cmds.items()
+    )
+    try:
+        out = printer_cmd(ssh, script)
+    except Exception:
+        return {key: "ERR" for key in cmds}
+    sections = {m.group(1): (m.group(2), m.group(3)) for m in SECTION_RE.finditer(out)}
+    return {key: text if rc == "0" else "ERR"
+            for key, (text, rc) in ((k, sections.get(k, ("", "1"))) for k in cmds)}
+
+def dump_partition(ssh, p, compress):
+    """Stream /dev/mmcblk0pN straight to the host; nothing is staged on the printer."""
+    dest = BACKUP_DIR / (f"part{p}.img.zst" if compress else f"part{p}.img")
+    dev = f"/dev/mmcblk0p{p}"
+    # a pipeline exits with zstd's status, so dd reports its own failure on stderr
+    # (works in busybox ash, which may lack pipefail)
+    remote = f"[ -b {dev} ] || exit 1; {{ dd if={dev} bs=4M 2>/dev/null || echo {DD_FAILED} >&2; }}"
+    if compress:
+        remote += " | zstd -T0 -3"
+    cmd = ["ssh", *SSH_OPTS, *MUX, ssh, remote]
+    print(f"$ {' '.join(cmd)} > {dest}")
+    with open(dest, "wb") as out:
+        res = subprocess.run(cmd, stdout=out, stderr=subprocess.PIPE)
+    if res.returncode != 0 or DD_FAILED.encode() in res.stderr:
+        print(f"⚠️ part{p}: {res.stderr.decode(errors='replace').strip() or f'exit {res.returncode}'}")
+        dest.unlink(missing_ok=True)
+        return False
+    return True
 
 def main():
     if len(sys.argv) < 2:
@@ -28,41 +86,38 @@ def main():
     BACKUP_DIR.mkdir(parents=True, exist_ok=True)
     info = {}
 
-    print("\n🔍 Collecting printer hardware data...\n")
-    cmds = {
-        "cmdline": "cat /proc/cmdline",
-        "partitions": "cat /proc/partitions",
-        "mounts": "mount",
-        "dmesg": "dmesg",
-        "modules": "find /lib/modules -type f -name '*.ko'",
-        "input_devices": "cat /proc/bus/input/devices",
-        "video": "ls -l /dev/video* 2>/dev/null",
-        "soc": "cat /proc/device-tree/compatible 2>/dev/null",
-        "panel": "grep -Ei \"gc|dsi|mipi\" /proc/cmdline",
-        "wifi_fw": "ls -l /lib/firmware 2>/dev/null && ls -l /lib/firmware/brcm 2>/dev/null",
-    }
-
-    for key, cmd in cmds.items():
-        print(f"📎 {key}...")
-        try:
-            info[key] = printer_cmd(ssh, cmd)
-        except:
-            info[key] = "ERR"
-
-    # ✅ Backup partitions
-    print("\n💾 Backing up mmcblk0 partitions (p1–p14)...")
-    for p in range(1, 15):
-        outfile = f"/mnt/UDISK/part{p}.img"
-        try:
-            printer_cmd(ssh, f"dd if=/dev/mmcblk0p{p} of={outfile} bs=1M")
-        except Exception:
-            info[f"part{p}_dd"] = "FAILED"
-            continue
-
-        # Copy to host
-        dest = BACKUP_DIR / f"part{p}.img"
-        print(f"⬇️ pulling part{p}.img...")
-        fetch(ssh, outfile, dest)
+    if not open_master(ssh):
+        print("⚠️ could not open an ssh ControlMaster; every command will connect separately")
+    try:
+        print("\n🔍 Collecting printer hardware data...\n")
+        cmds = {
+            "cmdline": "cat /proc/cmdline",
+            "partitions": "cat /proc/partitions",
+            "mounts": "mount",
+            "dmesg": "dmesg",
+            "modules": "find /lib/modules -type f -name '*.ko'",
+            "input_devices": "cat /proc/bus/input/devices",
+            "video": "ls -l /dev/video* 2>/dev/null",
+            "soc": "cat /proc/device-tree/compatible 2>/dev/null",
+            "panel": "grep -Ei \"gc|dsi|mipi\" /proc/cmdline",
+            "wifi_fw": "ls -l /lib/firmware 2>/dev/null && ls -l /lib/firmware/brcm 2>/dev/null",
+            # not saved: decides whether partition dumps are compressed on the printer
+            "has_zstd": "command -v zstd",
+        }
+
+        print(f"📎 {', '.join(k for k in cmds if k != 'has_zstd')}...")
+        info.update(printer_cmds(ssh, cmds))
+
+        # ✅ Backup partitions (streamed over ssh, zstd-compressed on the printer when available)
+        compress = info.pop("has_zstd") != "ERR"
+        print(f"\n💾 Backing up mmcblk0 partitions (p1–p14){' with zstd' if compress else ''}...")
+        parts = range(1, 15)
+        with ThreadPoolExecutor(max_workers=DUMP_WORKERS) as ex:
+            for p, ok in zip(parts, ex.map(lambda p: dump_partition(ssh, p, compress), parts)):
+                if not ok:
+                    info[f"part{p}_dd"] = "FAILED"
+    finally:
+        close_master(ssh)
 
     # ✅ Save logs + metadata locally
     with open(BACKUP_DIR / "printer_info.json", "w") as f:
@@ -16,8 +16,21 @@ except Exception:
 
 colorama_init()
 
+# orjson is optional; without it fall back to compact stdlib json (no indent/sort: fast C path)
+try:
+    import orjson
+    def _dumps(obj: Any) -> bytes:
+        return orjson.dumps(obj)
+except Exception:
+    def _dumps(obj: Any) -> bytes:
+        return json.dumps(obj, separators=(",", ":")).encode()
+
 OUTPUT_DIR = os.environ.get("OUTPUT_DIR", "/repo/output")
-PROG_JSON  = os.path.join(OUTPUT_DIR, "progress.json")
+PROG_JSON  = os.path.join(OUTPUT_DIR, "progress.json")   # small snapshot: current stage only
+PROG_JSONL = os.path.join(OUTPUT_DIR, "progress.jsonl")  # append-only history, one entry per line
+
+# Loaded from disk once per process, then kept in step with our own appends
+_CACHE: Dict[str, Any] = {"current": None, "history": None}
 
 def _ensure_dir():
     os.makedirs(OUTPUT_DIR, exist_ok=True)
@@ -31,10 +44,42 @@ def _read_json(path: str) -> Dict[str, Any]:
 
 def _write_json(path: str, data: Dict[str, Any]) -> None:
     tmp = path + ".tmp"
-    with open(tmp, "w") as f:
-        json.dump(data, f, indent=2, sort_keys=True)
+    with open(tmp, "wb") as f:
+        f.write(_dumps(data))
     os.replace(tmp, path)
 
+def _read_jsonl(path: str):
+    try:
+        with open(path, "r") as f:
+            lines = f.readlines()
+    except FileNotFoundError:
+        return None
+    out = []
+    for line in lines:
+        try:
+            out.append(json.loads(line))
+        except ValueError:
+            continue
+    return out
+
+def _append_jsonl(path: str, entries: List[Dict[str, Any]]) -> None:
+    with open(path, "ab") as f:
+        f.write(b"".join(_dumps(e) + b"\n" for e in entries))
+
+def _load() -> Dict[str, Any]:
+    if _CACHE["history"] is None:
+        snap = _read_json(PROG_JSON)
+        history = _read_jsonl(PROG_JSONL)
+        if history is None:
+            # older runs kept the whole history inside progress.json
+            history = snap.get("history", [])
+            if history:
+                _ensure_dir()
+                _append_jsonl(PROG_JSONL, history)
+        _CACHE["history"] = history
+        _CACHE["current"] = snap.get("current") or (history[-1].get("stage") if history else "none")
+    return _CACHE
+
 def _ts() -> str:
     return time.strftime("%Y-%m-%d %H:%M:%S")
 
@@ -54,8 +99,7 @@ def pretty_stage(stage: str) -> str:
 
 def update_progress(stage: str, message: str, status: str = "info", extra: Dict[str, Any] = None):
     _ensure_dir()
-    data = _read_json(PROG_JSON)
-    history: List[Dict[str, Any]] = data.get("history", [])
+    cache = _load()
     entry = {
         "time": _ts(),
         "stage": stage,
@@ -64,22 +108,20 @@ def update_progress(stage: str, message: str, status: str = "info", extra: Dict[
     }
     if extra:
         entry["extra"] = extra
-    history.append(entry)
-    data["history"] = history
-    data["current"] = stage
-    _write_json(PROG_JSON, data)
+    _append_jsonl(PROG_JSONL, [entry])
+    cache["history"].append(entry)
+    cache["current"] = stage
+    _write_json(PROG_JSON, {"current": stage})
 
     color = {"info": Fore.CYAN, "ok": Fore.GREEN, "warn": Fore.YELLOW, "error": Fore.RED}.get(status, "")
     print(f"{color}[progress]{Style.RESET_ALL} {pretty_stage(stage)} — {message}")
 
 def get_history():
     """Return the entire progress history list (safe for UI/menus)."""
-    data = _read_json(PROG_JSON)
-    return data.get("history", [])
+    return list(_load()["history"])
 
 def current_stage() -> str:
-    data = _read_json(PROG_JSON)
-    return data.get("current", "none")
+    return _load()["current"]
 
 if __name__ == "__main__":
     # tiny CLI for debugging
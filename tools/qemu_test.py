@@ -32,40 +32,31 @@ Outputs:
   - /repo/output/qemu_test_report.json
   - checkpoint.json stage update
 """
-import json, os, re, shutil, subprocess, sys, time
+import json, os, subprocess, sys, time
+from functools import lru_cache
 from pathlib import Path
+from utils import which_cached
+from checkpoint import get_checkpoint, stage_done
+from progress import update_progress
+from _qemu_run import wait_for_banner
 
-# ---------- small local checkpoint helpers (compatible with your existing ones) ----------
+# ---------- checkpoint helpers (thin wrappers over checkpoint.py) ----------
 OUT_DIR = Path(os.environ.get("OUT_DIR", "/repo/output")).resolve()
-STATE_DIR = OUT_DIR
-CHECKPOINT_JSON = STATE_DIR / "checkpoint.json"
-PROGRESS_JSON = STATE_DIR / "progress.json"
 
 def _now():
     return time.strftime("%Y-%m-%d %H:%M:%S")
 
 def load_checkpoint():
-    if CHECKPOINT_JSON.exists():
-        with open(CHECKPOINT_JSON, "r") as f:
-            return json.load(f)
-    return {"stage": "none", "meta": {}}
+    # checkpoint.py owns the file: cached on (mtime_ns, size), so other writers invalidate it
+    return get_checkpoint()
 
 def save_checkpoint(stage=None, **meta):
-    data = load_checkpoint()
-    if stage:
-        data["stage"] = stage
-    if "meta" not in data: data["meta"] = {}
-    data["meta"].update(meta)
-    with open(CHECKPOINT_JSON, "w") as f:
-        json.dump(data, f, indent=2)
-    # also append to progress.json for human-friendly timeline
-    line = {
-        "ts": _now(),
-        "stage": stage or data.get("stage"),
-        "meta": meta,
-    }
-    with open(PROGRESS_JSON, "a") as f:
-        f.write(json.dumps(line) + "\n")
+    stage = stage or load_checkpoint().get("stage", "none")
+    stage_done(stage, **meta)
+    # also log to progress.jsonl for human-friendly timeline (progress.py schema)
+    details = ", ".join(f"{k}={v}" for k, v in meta.items())
+    update_progress(stage, f"QEMU smoke test: {details}" if details else "QEMU smoke test",
+                    status="ok" if stage.endswith("_passed") else "info", extra=meta or None)
 
 # ---------- util ----------
 def info(msg):  print(f"[{_now()}] [INFO] {msg}")
@@ -73,48 +64,62 @@ def warn(msg):  print(f"[{_now()}] [WARN] {msg}")
 def err(msg):   print(f"[{_now()}] [ERROR] {msg}", file=sys.stderr)
 
 def which(cmd):
-    p = shutil.which(cmd)
-    return p
+    return which_cached(cmd)
 
 def write_json(path: Path, obj):
     with open(path, "w") as f:
         json.dump(obj, f, indent=2)
 
 # ---------- discovery ----------
+WORK_ROOT = OUT_DIR / "work"
+CPIO_ROOT = OUT_DIR / "extracted" / "_latest_firmware.img.extracted" / "cpio-root"
+
+# big trees under work/ that never hold the kernel image: the unpacked target
+# rootfs and the upstream git clones
+WORK_SKIP = {"rootfs", "upstream"}
+KERNEL_NAMES = ("zImage", "uImage", "Image")
+
+@lru_cache(maxsize=None)
+def _scan_artifacts(roots):
+    """One os.walk over each root, classifying kernel and DTB candidates as we go.
+
+    Kernel preference (lowest rank wins): work/kernel, cpio-root/kernel, then
+    zImage, uImage, Image anywhere under work, then cpio-root/boot/*Image*.
+    DTB: the first *.dtb, roots searched in order. Stops once both are settled.
+    """
+    kernel, dtb = (99, None), None
+    for ri, root in enumerate(roots):
+        if not root.is_dir():
+            continue
+        for dirpath, dirs, files in os.walk(root, followlinks=False):
+            here = Path(dirpath)
+            if here == WORK_ROOT:
+                dirs[:] = [d for d in dirs if d not in WORK_SKIP]
+            for name in files:
+                p = here / name
+                rank = 99
+                if name == "kernel" and here == root:
+                    rank = ri
+                elif root == WORK_ROOT and name in KERNEL_NAMES:
+                    rank = 2 + KERNEL_NAMES.index(name)
+                elif root == CPIO_ROOT and here == root / "boot" and "Image" in name:
+                    rank = 5
+                if rank < kernel[0] and p.is_file():
+                    kernel = (rank, p)
+                if dtb is None and name.endswith(".dtb") and p.is_file():
+                    dtb = p
+            if kernel[0] == 0 and dtb is not None:
+                return {"kernel": kernel[1], "dtb": dtb}
+    return {"kernel": kernel[1], "dtb": dtb}
+
 def find_kernel():
-    # prefer already extracted kernel in work or extracted tree
-    candidates = [
-        OUT_DIR / "work" / "kernel",
-        OUT_DIR / "extracted" / "_latest_firmware.img.extracted" / "cpio-root" / "kernel",
-    ]
-    for p in candidates:
-        if p.exists() and p.is_file():
-            return p
-    # sometimes kernel is named 'Image', 'zImage', 'uImage' under cpio-root/boot/
-    alt_globs = [
-        OUT_DIR / "work" / "**" / "zImage",
-        OUT_DIR / "work" / "**" / "uImage",
-        OUT_DIR / "work" / "**" / "Image",
-        OUT_DIR / "extracted" / "_latest_firmware.img.extracted" / "cpio-root" / "boot" / "*Image*",
-    ]
-    for g in alt_globs:
-        for p in g.parent.glob(g.name):
-            if p.is_file():
-                return p
-    return None
+    # prefer already extracted kernel in work or extracted tree; sometimes it is
+    # named 'Image', 'zImage', 'uImage' (e.g. under cpio-root/boot/)
+    return _scan_artifacts((WORK_ROOT, CPIO_ROOT))["kernel"]
 
 def find_dtb():
     # optional; if present we'll pass -dtb to QEMU (not strictly required for -M virt)
-    roots = [
-        OUT_DIR / "work",
-        OUT_DIR / "extracted" / "_latest_firmware.img.extracted" / "cpio-root",
-    ]
-    for r in roots:
-        if not r.exists(): continue
-        for p in r.rglob("*.dtb"):
-            if p.is_file():
-                return p
-    return None
+    return _scan_artifacts((WORK_ROOT, CPIO_ROOT))["dtb"]
 
 def find_rootfs():
     # presence only (we don't mount it in QEMU 'virt' test)
@@ -122,12 +127,6 @@ def find_rootfs():
     return p if p.exists() and p.is_file() else None
 
 # ---------- qemu run ----------
-BOOT_OK_PATTERNS = [
-    re.compile(r"Linux version", re.I),
-    re.compile(r"Booting Linux", re.I),
-    re.compile(r"Starting kernel", re.I),
-]
-
 def run_qemu(kernel: Path, dtb: Path|None, timeout_s: int, machine: str, qemu_bin: str, log_path: Path):
     cmd = [
         qemu_bin,
@@ -142,59 +141,15 @@ def run_qemu(kernel: Path, dtb: Path|None, timeout_s: int, machine: str, qemu_bi
         cmd.extend(["-dtb", str(dtb)])
 
     info(f"Spawning QEMU: {' '.join(cmd)}")
-    with open(log_path, "wb") as logf:
-        try:
-            p = subprocess.Popen(cmd, stdout=logf, stderr=subprocess.STDOUT)
-        except FileNotFoundError:
-            return {"status": "error", "reason": f"qemu binary not found: {qemu_bin}"}
-        except Exception as e:
-            return {"status": "error", "reason": f"spawn failed: {e!r}"}
-
-        # Wait up to timeout while tailing the file looking for boot banners
-        start = time.time()
-        last_size = 0
-        matched = False
-        while True:
-            time.sleep(0.5)
-            # read tail incrementally
-            try:
-                with open(log_path, "rb") as rf:
-                    rf.seek(last_size)
-                    chunk = rf.read().decode("utf-8", errors="ignore")
-                    if chunk:
-                        # quick scan for success patterns
-                        for pat in BOOT_OK_PATTERNS:
-                            if pat.search(chunk):
-                                matched = True
-                                break
-                        last_size = rf.tell()
-            except Exception:
-                pass
-
-            if matched:
-                # give kernel a moment more, then stop
-                time.sleep(1.0)
-                p.terminate()
-                try:
-                    p.wait(timeout=3)
-                except subprocess.TimeoutExpired:
-                    p.kill()
-                return {"status": "passed", "reason": "kernel banner detected"}
-
-            if (time.time() - start) > timeout_s:
-                # timeout → stop qemu
-                try:
-                    p.terminate()
-                    p.wait(timeout=2)
-                except Exception:
-                    try: p.kill()
-                    except Exception: pass
-                break
-
-        # On timeout, judge by whether *any* output came out
-        had_output = log_path.exists() and log_path.stat().st_size > 0
-        return {"status": "failed" if had_output else "failed_no_output",
-                "reason": "timeout waiting for kernel banner"}
+    # truncate now so a failed spawn never leaves the previous run's log behind
+    log_path.write_bytes(b"")
+    try:
+        p = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, bufsize=0)
+    except FileNotFoundError:
+        return {"status": "error", "reason": f"qemu binary not found: {qemu_bin}"}
+    except Exception as e:
+        return {"status": "error", "reason": f"spawn failed: {e!r}"}
+    return wait_for_banner(p, log_path, timeout_s)
 
 # ---------- main ----------
 def main():
@@ -240,9 +195,6 @@ def main():
 
     info(f"QEMU machine: {machine}")
     info(f"Timeout: {timeout_s}s")
-    if log_path.exists():
-        try: log_path.unlink()
-        except Exception: pass
 
     result = run_qemu(kernel, dtb, timeout_s, machine, qemu_bin, log_path)
     status = result.get("status", "error")
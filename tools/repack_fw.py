@@ -1,7 +1,8 @@
 #!/usr/bin/env python3
-import os, sys, shutil, re
+import os, sys, re
+from concurrent.futures import ThreadPoolExecutor
 from colorama import Fore, Style
-from utils import run, ensure_dir, sha256sum, write_text
+from utils import run, sha256sum, write_text
 from progress import update_progress
 from checkpoint import get_checkpoint, stage_done
 
@@ -17,27 +18,84 @@ FINAL_IMG = os.path.join(OUT_DIR, "custom_firmware.img")
 KERNEL_IN = os.path.join(OUT_DIR, "extracted", "_latest_firmware.img.extracted", "kernel")
 UBOOT_IN  = os.path.join(OUT_DIR, "extracted", "_latest_firmware.img.extracted", "uboot")
 
-def update_swdesc_for_rootfs(path_desc, rootfs_squash):
-    if not os.path.exists(path_desc):
-        # minimal sw-description
-        write_text(path_desc,
-                   "software = {\n  version = \"k2rebuild\";\n  rootfs: file = \"rootfs\"; \n}\n")
-    txt = open(path_desc, "r").read()
+# This squashfs is flashed to the printer, so keep the stock xz unless asked otherwise.
+# SQUASH_COMP=zstd is much faster but only boots if the kernel has SQUASHFS_ZSTD.
+SQUASH_COMP = os.environ.get("SQUASH_COMP", "xz")
+
+def mksquashfs_cmd(src, dest):
+    cmd = ["mksquashfs", src, dest, "-comp", SQUASH_COMP, "-noappend", "-no-exports",
+           "-processors", str(os.cpu_count() or 1)]
+    if SQUASH_COMP == "zstd":
+        cmd += ["-Xcompression-level", "15"]
+    return cmd
+
+_ROOTFS_SHA_RE = re.compile(r'(rootfs_sha256\s*=\s*")[0-9a-f]*(")')
+_ROOTFS_SIZE_RE = re.compile(r'(rootfs_size\s*=\s*")[0-9]*(")')
+
+MINIMAL_SWDESC = "software = {\n  version = \"k2rebuild\";\n  rootfs: file = \"rootfs\"; \n}\n"
+
+def update_swdesc_for_rootfs(path_desc, rootfs_squash, sha=None):
+    try:
+        with open(path_desc, "r", encoding="utf-8") as f:
+            old = f.read()
+    except FileNotFoundError:
+        old = None
+    txt = MINIMAL_SWDESC if old is None else old
     # replace size/sha lines for rootfs if they exist; otherwise append
-    sha = sha256sum(rootfs_squash)
+    sha = sha or sha256sum(rootfs_squash)
     size = os.path.getsize(rootfs_squash)
-    txt = re.sub(r'(rootfs_sha256\s*=\s*")[0-9a-f]*(")', rf'\1{sha}\2', txt) if "rootfs_sha256" in txt else txt + f'\nrootfs_sha256="{sha}"\n'
-    txt = re.sub(r'(rootfs_size\s*=\s*")[0-9]*(")', rf'\1{size}\2', txt) if "rootfs_size" in txt else txt + f'rootfs_size="{size}"\n'
-    write_text(path_desc, txt)
-
-def write_cpio_item_md5(out_path, items):
-    lines = []
-    for name, fpath in items:
-        if not os.path.isfile(fpath):
-            continue
-        lines.append(f"{name}:{sha256sum(fpath)}")
+    txt = _ROOTFS_SHA_RE.sub(rf'\g<1>{sha}\g<2>', txt) if "rootfs_sha256" in txt else txt + f'\nrootfs_sha256="{sha}"\n'
+    txt = _ROOTFS_SIZE_RE.sub(rf'\g<1>{size}\g<2>', txt) if "rootfs_size" in txt else txt + f'rootfs_size="{size}"\n'
+    if txt == old:
+        return
+    write_text(path_desc + ".tmp", txt)
+    os.replace(path_desc + ".tmp", path_desc)
+
+def write_cpio_item_md5(out_path, items, digests=None):
+    # digests: {name: sha256} already known by the caller, e.g. the fresh rootfs
+    digests = dict(digests or {})
+    items = [(name, fpath) for name, fpath in items if os.path.isfile(fpath)]
+    todo = [(name, fpath) for name, fpath in items if not digests.get(name)]
+    # independent files; hashlib drops the GIL so the reads and digests overlap
+    with ThreadPoolExecutor(max_workers=4) as ex:
+        digests.update(zip([n for n, _ in todo], ex.map(sha256sum, [p for _, p in todo])))
+    lines = [f"{name}:{digests[name]}" for name, _ in items]
     write_text(out_path, "\n".join(lines) + "\n")
 
+CPIO_CHUNK = 4 * 1024 * 1024
+
+def _cpio_header(ino, mode, mtime, size, name, check=0):
+    name = name.encode() + b"\0"
+    fields = (ino, mode, 0, 0, 1, mtime, size, 0, 0, 0, 0, len(name), check)
+    hdr = b"070702" + b"".join(b"%08X" % v for v in fields) + name
+    return hdr + b"\0" * (-len(hdr) % 4)
+
+def write_cpio_crc(out_path, entries):
+    """Write an SVR4 CRC ("070702") cpio of (archive_name, path) entries, in order.
+
+    Every file is read exactly once: its bytes are streamed into the archive while
+    the byte-sum checksum accumulates, then the header's check field is patched.
+    """
+    with open(out_path, "wb") as out:
+        for ino, (name, path) in enumerate(entries, 1):
+            st = os.stat(path)
+            hdr_at = out.tell()
+            out.write(_cpio_header(ino, st.st_mode, int(st.st_mtime), st.st_size, name))
+            check = written = 0
+            with open(path, "rb") as f:
+                while chunk := f.read(CPIO_CHUNK):
+                    check += sum(chunk)
+                    written += len(chunk)
+                    out.write(chunk)
+            if written != st.st_size:
+                raise RuntimeError(f"{path} changed size while archiving")
+            out.write(b"\0" * (-written % 4))
+            end = out.tell()
+            out.seek(hdr_at + 6 + 12 * 8)  # check is the last of 13 header fields
+            out.write(b"%08X" % (check & 0xFFFFFFFF))
+            out.seek(end)
+        out.write(_cpio_header(0, 0, 0, 0, "TRAILER!!!"))
+
 def main():
     ck = get_checkpoint()
     if ck.get("stage") not in ("unsquash", "inject_upstream", "repack_fw"):
@@ -48,37 +106,33 @@ def main():
         sys.exit(1)
 
     print(f"{Fore.CYAN}[repack_fw]{Style.RESET_ALL} Building new squashfs from {ROOTFS_DIR} …")
-    run(["mksquashfs", ROOTFS_DIR, ROOTFS_SQUASH, "-comp", "xz", "-noappend"])
+    run(mksquashfs_cmd(ROOTFS_DIR, ROOTFS_SQUASH))
+    # hash the new squashfs once; everything below reuses this digest
+    rootfs_sha = sha256sum(ROOTFS_SQUASH)
 
     print(f"{Fore.CYAN}[repack_fw]{Style.RESET_ALL} Updating sw-description …")
-    update_swdesc_for_rootfs(SWDESC, ROOTFS_SQUASH)
+    update_swdesc_for_rootfs(SWDESC, ROOTFS_SQUASH, rootfs_sha)
 
     print(f"{Fore.CYAN}[repack_fw]{Style.RESET_ALL} Regenerating cpio_item_md5 …")
     items = [("rootfs", ROOTFS_SQUASH), ("sw-description", SWDESC)]
     if os.path.isfile(KERNEL_IN): items.append(("kernel", KERNEL_IN))
     if os.path.isfile(UBOOT_IN):  items.append(("uboot", UBOOT_IN))
-    write_cpio_item_md5(CPIO_MD5, items)
-
-    # Rebuild SWUpdate CPIO (order matters)
-    tmpdir = os.path.join(WORK_DIR, "cpio-build")
-    if os.path.isdir(tmpdir): shutil.rmtree(tmpdir)
-    ensure_dir(tmpdir)
+    write_cpio_item_md5(CPIO_MD5, items, {"rootfs": rootfs_sha})
 
-    # link staged components
-    shutil.copy2(SWDESC, os.path.join(tmpdir, "sw-description"))
-    shutil.copy2(ROOTFS_SQUASH, os.path.join(tmpdir, "rootfs"))
-    if os.path.isfile(KERNEL_IN): shutil.copy2(KERNEL_IN, os.path.join(tmpdir, "kernel"))
-    if os.path.isfile(UBOOT_IN):  shutil.copy2(UBOOT_IN,  os.path.join(tmpdir, "uboot"))
-    shutil.copy2(CPIO_MD5, os.path.join(tmpdir, "cpio_item_md5"))
+    # Rebuild SWUpdate CPIO straight from the sources (order matters: sw-description first)
+    entries = [("sw-description", SWDESC), ("rootfs", ROOTFS_SQUASH)]
+    if os.path.isfile(KERNEL_IN): entries.append(("kernel", KERNEL_IN))
+    if os.path.isfile(UBOOT_IN):  entries.append(("uboot", UBOOT_IN))
+    entries.append(("cpio_item_md5", CPIO_MD5))
 
-    # make CPIO archive
     print(f"{Fore.CYAN}[repack_fw]{Style.RESET_ALL} Creating SWUpdate CPIO …")
-    run(["bash", "-lc", f"cd {tmpdir} && find . | cpio -o -H crc > {FINAL_IMG}"])
+    write_cpio_crc(FINAL_IMG, entries)
 
     print(f"{Fore.GREEN}[repack_fw]{Style.RESET_ALL} ✅ Firmware CPIO ready: {FINAL_IMG}")
     update_progress("repack_fw", f"Firmware repacked: {os.path.basename(FINAL_IMG)}",
-                    extra={"rootfs_sha256": sha256sum(ROOTFS_SQUASH), "swdesc": SWDESC})
-    stage_done("repack_fw", image=FINAL_IMG, rootfs_squash=ROOTFS_SQUASH, sw_description=SWDESC, cpio_md5=CPIO_MD5)
+                    extra={"rootfs_sha256": rootfs_sha, "swdesc": SWDESC})
+    stage_done("repack_fw", image=FINAL_IMG, rootfs_squash=ROOTFS_SQUASH, sw_description=SWDESC, cpio_md5=CPIO_MD5,
+               rootfs_sha256=rootfs_sha, rootfs_size=os.path.getsize(ROOTFS_SQUASH))
 
 if __name__ == "__main__":
     main()
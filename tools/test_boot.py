@@ -1,11 +1,13 @@
 #!/usr/bin/env python3
 import os, sys, subprocess, time
-from checkpoint import get_checkpoint, update_checkpoint, stage_done, write_error
+from checkpoint import stage_done
+from _qemu_run import wait_for_banner
 
 OUTPUT_DIR = os.environ.get("OUTPUT_DIR", "/repo/output")
 WORK_DIR   = os.path.join(OUTPUT_DIR, "work")
 LOG_PATH   = os.path.join(OUTPUT_DIR, "qemu_boot.log")
 QEMU_BIN   = "/usr/bin/qemu-system-arm"
+BOOT_TIMEOUT = int(os.environ.get("TEST_BOOT_TIMEOUT", "30"))
 
 def log(msg):
     print(f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] 🧠 {msg}", flush=True)
@@ -26,11 +28,11 @@ def main():
     dtb    = find_component("sun8iw20p1.dtb")
 
     if not kernel or not rootfs:
-        write_error("Missing kernel or rootfs for QEMU test")
+        stage_done("test_boot_failed", error="Missing kernel or rootfs for QEMU test")
         sys.exit("❌ Cannot boot: kernel or rootfs missing")
 
     if not os.path.exists(QEMU_BIN):
-        write_error("QEMU not installed in container")
+        stage_done("test_boot_failed", error="QEMU not installed in container")
         sys.exit("❌ qemu-system-arm binary not found")
 
     # Build qemu command for Allwinner T113 (ARMv7)
@@ -51,20 +53,16 @@ def main():
     log("Launching QEMU …")
     log(f"Command: {' '.join(qemu_cmd)}")
 
-    with open(LOG_PATH, "w") as f:
-        proc = subprocess.Popen(qemu_cmd, stdout=f, stderr=subprocess.STDOUT)
+    proc = subprocess.Popen(qemu_cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, bufsize=0)
 
-    # wait ~30 seconds for kernel + init sequence
-    time.sleep(30)
-    proc.terminate()
-    time.sleep(3)
-
-    if proc.poll() is None:
-        proc.kill()
-    log("🧾 QEMU run complete; log captured.")
-    update_checkpoint({"qemu_log": LOG_PATH})
-    stage_done("test_boot", qemu_log=LOG_PATH)
-    log(f"✅ Log saved: {LOG_PATH}")
+    # stop as soon as the kernel banner shows up, or after BOOT_TIMEOUT seconds
+    result = wait_for_banner(proc, LOG_PATH, BOOT_TIMEOUT)
+    log(f"🧾 QEMU run complete: {result['status']} ({result['reason']})")
+    if result["status"] != "passed":
+        stage_done("test_boot_failed", qemu_log=LOG_PATH, status=result["status"], error=result["reason"])
+        sys.exit(f"❌ Boot test failed: {result['reason']} (log: {LOG_PATH})")
+    stage_done("test_boot", qemu_log=LOG_PATH, status=result["status"])
+    log(f"✅ Kernel booted; log saved: {LOG_PATH}")
 
 if __name__ == "__main__":
     main()
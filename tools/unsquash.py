@@ -8,7 +8,6 @@ from checkpoint import get_checkpoint, stage_done
 OUT_DIR = os.environ.get("OUT_DIR", "/repo/output")
 WORK_DIR = os.path.join(OUT_DIR, "work")
 ROOTFS_WORK = os.path.join(WORK_DIR, "rootfs")
-ROOTFS_SQUASH = os.path.join(WORK_DIR, "rootfs.squashfs")
 
 def main():
     ck = get_checkpoint()
@@ -18,17 +17,20 @@ def main():
         sys.exit(1)
 
     ensure_dir(ROOTFS_WORK)
-    print(f"{Fore.CYAN}[unsquash]{Style.RESET_ALL} Extracting squashfs from source dir → {ROOTFS_WORK}")
-
-    # If the source is already a directory tree, pack to squash then unsquash for normalization
-    # 1) Create temporary squashfs from src
-    tmp_squash = ROOTFS_SQUASH
-    run(["mksquashfs", src, tmp_squash, "-comp", "xz", "-noappend"])
-    # 2) Unsquash into work tree
-    run(["unsquashfs", "-f", "-d", ROOTFS_WORK, tmp_squash])
+    if os.path.isdir(src):
+        # Already a tree: copy it as-is (reflinks on CoW filesystems). Packing it to
+        # squashfs just to unpack it again cost a full xz compress + decompress;
+        # repack_fw builds the squashfs it ships.
+        print(f"{Fore.CYAN}[unsquash]{Style.RESET_ALL} Copying rootfs tree {src} → {ROOTFS_WORK}")
+        run(["cp", "-a", "--reflink=auto", os.path.join(src, "."), ROOTFS_WORK])
+        artifacts = {"rootfs_dir": ROOTFS_WORK}
+    else:
+        print(f"{Fore.CYAN}[unsquash]{Style.RESET_ALL} Extracting squashfs {src} → {ROOTFS_WORK}")
+        run(["unsquashfs", "-f", "-d", ROOTFS_WORK, src])
+        artifacts = {"rootfs_dir": ROOTFS_WORK, "rootfs_squash": src}
 
     update_progress("unsquash", f"Extracted filesystem into {ROOTFS_WORK}")
-    stage_done("unsquash", rootfs_dir=ROOTFS_WORK, rootfs_squash=ROOTFS_SQUASH)
+    stage_done("unsquash", **artifacts)
 
 if __name__ == "__main__":
     main()
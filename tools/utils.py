@@ -1,5 +1,5 @@
 #!/usr/bin/env python3
-import subprocess, os, hashlib, shutil
+import subprocess, os, hashlib, mmap, shutil
 
 def run(cmd, cwd=None, check=True, capture=False, env=None):
     if capture:
@@ -7,12 +7,65 @@ def run(cmd, cwd=None, check=True, capture=False, env=None):
     else:
         subprocess.check_call(cmd, cwd=cwd, env=env)
 
+# path -> (st_size, st_mtime_ns, hexdigest); a rewritten file misses on size/mtime
+_sha_cache: dict[str, tuple[int, int, str]] = {}
+
+def cached_sha256(path: str) -> str | None:
+    """Digest sha256sum() already computed for path, if the file is unchanged since."""
+    hit = _sha_cache.get(path)
+    if not hit:
+        return None
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return hit[2] if hit[:2] == (st.st_size, st.st_mtime_ns) else None
+
 def sha256sum(path: str) -> str:
-    h = hashlib.sha256()
-    with open(path, "rb") as f:
-        for chunk in iter(lambda: f.read(65536), b""):
-            h.update(chunk)
-    return h.hexdigest()
+    # unbuffered: file_digest/mmap read the fd directly, a BufferedReader only adds a copy
+    with open(path, "rb", buffering=0) as f:
+        st = os.fstat(f.fileno())
+        hit = _sha_cache.get(path)
+        if hit and hit[:2] == (st.st_size, st.st_mtime_ns):
+            return hit[2]
+        if hasattr(hashlib, "file_digest"):
+            digest = hashlib.file_digest(f, "sha256").hexdigest()
+        else:
+            # pre-3.11: hand OpenSSL the whole mapping in one update()
+            h = hashlib.sha256()
+            if st.st_size:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    h.update(mm)
+            digest = h.hexdigest()
+    _sha_cache[path] = (st.st_size, st.st_mtime_ns, digest)
+    return digest
+
+# name -> candidate paths in $PATH order, built with one scandir per PATH dir
+_PATH_INDEX: dict[str, list[str]] | None = None
+_which_cache: dict[str, str | None] = {}
+
+def _path_index() -> dict[str, list[str]]:
+    global _PATH_INDEX
+    if _PATH_INDEX is None:
+        index = {}
+        for d in os.environ.get("PATH", os.defpath).split(os.pathsep):
+            try:
+                with os.scandir(d or ".") as it:
+                    for entry in it:
+                        index.setdefault(entry.name, []).append(entry.path)
+            except OSError:
+                continue
+        _PATH_INDEX = index
+    return _PATH_INDEX
+
+def which_cached(cmd: str) -> str | None:
+    """shutil.which() answered from a one-time $PATH index; results are memoized."""
+    if os.sep in cmd:
+        return shutil.which(cmd)
+    if cmd not in _which_cache:
+        _which_cache[cmd] = next((p for p in _path_index().get(cmd, ())
+                                  if os.path.isfile(p) and os.access(p, os.X_OK)), None)
+    return _which_cache[cmd]
 
 def ensure_dir(path: str):
     os.makedirs(path, exist_ok=True)
@@ -1,7 +1,21 @@
 #!/opt/k2env/bin/python3
 import re
 
+# both fields in one alternation so the text is scanned once
+_PAT = re.compile(r'(sha256\s*=\s*)".*?"|(size\s*=\s*)\d+;')
+
 def update_rootfs_hash_size(text: str, sha256: str, size: int) -> str:
-    text = re.sub(r'(sha256\s*=\s*)".*?"', rf'\1"{sha256}"', text)
-    text = re.sub(r'(size\s*=\s*)\d+;', rf'\1{size};', text)
-    return text
+    def _sub(m):
+        if m.group(1) is not None:
+            return f'{m.group(1)}"{sha256}"'
+        return f'{m.group(2)}{size};'
+    return _PAT.sub(_sub, text)
+
+if __name__ == "__main__":
+    # self-check: updated fields read back, and a second update replaces them again
+    sample = 'rootfs: {\n    sha256 = "old";\n    size = 1;\n};\n'
+    for sha, size in (("ab" * 32, 123), ("cd" * 32, 4567)):
+        sample = update_rootfs_hash_size(sample, sha, size)
+        assert re.search(r'sha256\s*=\s*"(.*?)"', sample).group(1) == sha, sample
+        assert int(re.search(r'size\s*=\s*(\d+);', sample).group(1)) == size, sample
+    print("ok")
@@ -3,7 +3,9 @@
 
 import os, json, sys, hashlib
 from typing import Dict
-from checkpoint import stage_done
+from concurrent.futures import ThreadPoolExecutor
+from checkpoint import get_checkpoint, stage_done
+from utils import cached_sha256
 from progress import update_progress
 
 OUTPUT_DIR = os.environ.get("OUTPUT_DIR", "/repo/output")
@@ -19,45 +21,60 @@ OPTIONAL = {
 }
 
 def sha256sum(path: str) -> str:
-    h = hashlib.sha256()
-    with open(path, "rb") as f:
-        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+    with open(path, "rb", buffering=0) as f:
+        if hasattr(hashlib, "file_digest"):
+            return hashlib.file_digest(f, "sha256").hexdigest()
+        h = hashlib.sha256()
+        for chunk in iter(lambda: f.read(4 * 1024 * 1024), b""):
             h.update(chunk)
-    return h.hexdigest()
+        return h.hexdigest()
 
-def verify_component(name: str, path: str) -> Dict[str, str]:
+def verify_component(name: str, path: str, expected_sha: str = None, expected_size: int = None) -> Dict[str, str]:
     if not os.path.exists(path):
         return {"status": "missing", "sha256": "-"}
     if os.path.isdir(path):
         return {"status": "error", "sha256": "-", "error": "is directory"}
-    return {"status": "ok", "sha256": sha256sum(path)}
+    # a size mismatch already fails the check; don't read the file to prove it
+    if expected_size is not None and os.path.getsize(path) != expected_size:
+        return {"status": "size_mismatch", "sha256": "-"}
+    # repack_fw hashed it earlier in this process and it hasn't changed since
+    if expected_sha is not None and cached_sha256(path) == expected_sha:
+        return {"status": "ok", "sha256": expected_sha}
+    digest = sha256sum(path)
+    if expected_sha is not None and digest != expected_sha:
+        return {"status": "sha_mismatch", "sha256": digest}
+    return {"status": "ok", "sha256": digest}
 
 def main():
     update_progress("validate_fw", "Starting firmware validation …", status="info")
     results = {}
 
-    # Required first
-    missing = []
-    for n, p in REQUIRED.items():
-        r = verify_component(n, p)
-        results[n] = r
-        if r["status"] != "ok":
-            missing.append(n)
-
-    # Optional after
-    for n, p in OPTIONAL.items():
-        r = verify_component(n, p)
-        results[n] = r
+    # Hash every component concurrently; required first in the report order
+    components = {**REQUIRED, **OPTIONAL}
+    # what repack_fw recorded about the squashfs it built
+    meta = get_checkpoint().get("meta", {})
+    expected = {"rootfs": (meta.get("rootfs_sha256"), meta.get("rootfs_size"))}
+    def check(name):
+        return verify_component(name, components[name], *expected.get(name, (None, None)))
+    with ThreadPoolExecutor(max_workers=4) as ex:
+        results.update(zip(components, ex.map(check, components)))
+    missing = [n for n in REQUIRED if results[n]["status"] in ("missing", "error")]
+    mismatched = [n for n in REQUIRED if results[n]["status"] in ("size_mismatch", "sha_mismatch")]
 
     # Render a quick summary to file
     summary_path = os.path.join(OUTPUT_DIR, "rebuilt_validation_report.json")
-    with open(summary_path, "w") as f:
-        json.dump(results, f, indent=2, sort_keys=True)
+    with open(summary_path, "wb") as f:
+        f.write(json.dumps(results, indent=2, sort_keys=True).encode())
 
-    if missing:
-        update_progress("validate_fw", f"Missing required: {', '.join(missing)}", status="error", extra=results)
-        stage_done("validate_failed", missing=missing, results=results)
-        print("Validation failed:", ", ".join(missing))
+    if missing or mismatched:
+        problems = []
+        if missing:
+            problems.append(f"Missing required: {', '.join(missing)}")
+        if mismatched:
+            problems.append(f"Changed since repack: {', '.join(mismatched)}")
+        update_progress("validate_fw", "; ".join(problems), status="error", extra=results)
+        stage_done("validate_failed", missing=missing, mismatched=mismatched, results=results)
+        print("Validation failed:", "; ".join(problems))
         sys.exit(1)
 
     update_progress("validate_fw", "All required components OK", status="ok", extra=results)
@@ -9,10 +9,10 @@ This script exits with a non-zero code if anything is missing or misconfigured.
 """
 
 import os
-import shutil
 import sys
 import subprocess
 from colorama import Fore, Style
+from utils import which_cached
 
 # Required binaries
 BINARIES = [
@@ -33,7 +33,7 @@ def check_binaries():
     missing = []
     print(Fore.CYAN + "\n[verify_env] 🔍 Checking system binaries..." + Style.RESET_ALL)
     for b in BINARIES:
-        path = shutil.which(b)
+        path = which_cached(b)
         if path:
             print(f"  ✅ {b:20s} → {path}")
         else: